@@ -2,11 +2,21 @@
 
 import os
 import time
+import numpy as np
 import requests
 import pandas as pd
-from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from zoneinfo import ZoneInfo
 
+try:
+    import orjson  # much faster than stdlib json on the numeric o/h/l/c/v/t arrays
+except ImportError:
+    orjson = None
+
 # --- symbol & timeframe lists ---
 CRYPTO = ["btcusd", "ethusd", "xrpusd"]
 FOREX = ["usdx", "eurusd", "gbpusd", "usdchf", "audusd", "nzdusd", "usdcad"]
@@ -14,18 +24,68 @@ SYMBOLS = CRYPTO + FOREX
 
 TIMEFRAMES = ["1", "5", "15", "30", "60", "240", "D"]
 
+MAX_WORKERS = 16
+
+# --- constants shared by every fetch ---
+_TF_SECONDS = {"1": 60, "5": 300, "15": 900, "30": 1800, "60": 3600, "240": 14400, "D": 86400}
+
+_BASE_URL = "https://my.litefinance.org/chart/get-history"
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "Referer": "https://my.litefinance.org/",
+    "X-Requested-With": "XMLHttpRequest",
+}
+
+# --- shared session: reuses TCP/TLS connections across all fetches, with
+# --- exponential backoff retries handled inside urllib3 ---
+_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+SESSION = requests.Session()
+SESSION.headers.update(_HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=_RETRY),
+)
+
 
-# --- timeframe to seconds ---
-def tf_to_seconds(tf: str) -> int:
-    if tf == "D":
-        return 86400
-    return int(tf) * 60
+# --- cached string parse: repeated date strings skip the strptime cost ---
+@lru_cache(maxsize=4096)
+def _parse_str_ts(s: str, assume_tz: str | None) -> int:
+    ts = pd.to_datetime(s, errors="raise")
+    if ts.tz is None:
+        ts = ts.tz_localize(assume_tz if assume_tz else "UTC")
+    return int(ts.tz_convert("UTC").timestamp())
 
 
 # --- improved helper to convert many input types to unix seconds ---
 def to_unix_timestamp(value, assume_tz: str | None = "Asia/Qatar") -> int | None:
     if value is None:
         return None
+    if isinstance(value, (list, np.ndarray, pd.Series)):
+        arr = np.asarray(value)
+        if arr.dtype.kind == "O":
+            try:
+                arr = arr.astype("float64")  # numeric batch with None/NaN holes
+            except (TypeError, ValueError):
+                pass  # strings/datetimes: parse below
+        if arr.dtype.kind in "iuf":
+            # epoch numbers: same ms-vs-s heuristic as the numeric scalar
+            # branch, with missing entries coming back as None like the
+            # scalar None branch
+            valid = ~np.isnan(arr) if arr.dtype.kind == "f" else np.ones(len(arr), dtype=bool)
+            iv = np.where(valid, arr, 0).astype("int64")
+            iv = np.where(iv > 1_000_000_000_000, iv // 1000, iv)
+            return [int(v) if ok else None for v, ok in zip(iv.tolist(), valid.tolist())]
+        # vectorized fast path: one to_datetime call for the whole batch
+        ts = pd.DatetimeIndex(pd.to_datetime(value, errors="raise"))
+        if ts.tz is None:
+            ts = ts.tz_localize(assume_tz if assume_tz else "UTC")
+        ts = ts.tz_convert("UTC")
+        # divide by the index's actual resolution — newer pandas may parse
+        # to us instead of ns (older pandas has no .unit and is always ns)
+        per_sec = {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}[getattr(ts, "unit", "ns")]
+        return (ts.asi8 // per_sec).tolist()
     if isinstance(value, (int, float)):
         iv = int(value)
         if iv > 1_000_000_000_000:
@@ -38,107 +98,155 @@ def to_unix_timestamp(value, assume_tz: str | None = "Asia/Qatar") -> int | None
         ts = ts.tz_convert("UTC")
         return int(ts.timestamp())
     if isinstance(value, str):
-        ts = pd.to_datetime(value, errors="raise")
-        if ts.tz is None:
-            ts = ts.tz_localize(assume_tz if assume_tz else "UTC")
-        ts = ts.tz_convert("UTC")
-        return int(ts.timestamp())
+        return _parse_str_ts(value, assume_tz)
     raise TypeError(f"Unsupported type for timestamp conversion: {type(value)}")
 
 
+# --- price column to float64 without per-element type inspection ---
+def _float_col(values) -> np.ndarray:
+    try:
+        return np.asarray(values or [], dtype="float64")
+    except (TypeError, ValueError):
+        # non-numeric junk snuck in; fall back to coercing element-wise
+        return np.asarray(pd.to_numeric(values, errors="coerce"), dtype="float64")
+
+
 # --- normalize OHLC and convert datetimes ---
 def normalize_ohlc(ohlc_data: dict, return_tz_offset_minutes: int = 210) -> pd.DataFrame:
     if not ohlc_data:
         return pd.DataFrame()
 
-    t_list = list(ohlc_data.get("t", []))
-    if max(t_list or [0]) > 1_000_000_000_000:
-        t_list = [int(x) // 1000 if (x is not None and pd.notna(x)) else None for x in t_list]
-
-    target_tz = timezone(timedelta(minutes=return_tz_offset_minutes))
-    datetimes = [
-        datetime.fromtimestamp(int(ts), tz=timezone.utc).astimezone(target_tz) if ts else pd.NaT
-        for ts in t_list
-    ]
+    # one float64 array does the ms-detection scan, the ms->s division and
+    # the validity mask in C instead of per-element Python loops
+    arr = np.asarray(list(ohlc_data.get("t", [])), dtype="object").astype("float64")
+    max_val = np.nanmax(arr) if arr.size and not np.isnan(arr).all() else 0
+    if max_val > 1_000_000_000_000:
+        arr = np.floor_divide(arr, 1000)
+    mask = ~np.isnan(arr) & (arr != 0)
+
+    # a candle without a timestamp is useless — drop it instead of carrying
+    # a NaT row through to the stored csv/parquet.
+    # the output is naive local time, so apply the offset as plain int64
+    # nanosecond arithmetic instead of going through tz-aware datetimes
+    offset_ns = return_tz_offset_minutes * 60 * 1_000_000_000
+    arr_ns = arr[mask].astype("int64") * 1_000_000_000 + offset_ns
+
+    # sort the raw arrays once via argsort on the int64 epochs instead of
+    # re-sorting the assembled DataFrame through the block manager
+    order = np.argsort(arr_ns, kind="stable")
+    arr_ns = arr_ns[order]
+    keep = np.flatnonzero(mask)[order]  # filters invalid rows and sorts in one index
 
     df = pd.DataFrame({
-        "Date": pd.DatetimeIndex(datetimes),
-        "Open": pd.to_numeric(ohlc_data.get("o", []), errors="coerce"),
-        "High": pd.to_numeric(ohlc_data.get("h", []), errors="coerce"),
-        "Low": pd.to_numeric(ohlc_data.get("l", []), errors="coerce"),
-        "Close": pd.to_numeric(ohlc_data.get("c", []), errors="coerce"),
-        "Volume": pd.to_numeric(ohlc_data.get("v", []), errors="coerce") if "v" in ohlc_data else 0,
+        "Date": arr_ns.view("datetime64[ns]"),
+        "Open": _float_col(ohlc_data.get("o"))[keep],
+        "High": _float_col(ohlc_data.get("h"))[keep],
+        "Low": _float_col(ohlc_data.get("l"))[keep],
+        "Close": _float_col(ohlc_data.get("c"))[keep],
+        "Volume": _float_col(ohlc_data.get("v"))[keep] if "v" in ohlc_data else 0,
     })
-
-    df.sort_values("Date", inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    df["Date"] = df["Date"].dt.tz_localize(None)  # remove timezone
     return df
 
 
 # --- get_ohlc with dynamic lookback ---
-def get_ohlc(symbol: str, timeframe: str, input_tz: str | None = "Asia/Qatar") -> pd.DataFrame:
+def get_ohlc(symbol: str, timeframe: str, input_tz: str | None = "Asia/Qatar") -> pd.DataFrame | None:
     now = int(time.time())
-    candle_sec = tf_to_seconds(timeframe)
+    candle_sec = _TF_SECONDS[timeframe]
     from_unix = now - candle_sec * 10_000
     to_unix = now
 
     try:
         lite_finance_url = (
-            "https://my.litefinance.org/chart/get-history"
-            f"?symbol={symbol.upper()}&resolution={timeframe}&from={from_unix}&to={to_unix}"
+            f"{_BASE_URL}?symbol={symbol.upper()}&resolution={timeframe}&from={from_unix}&to={to_unix}"
         )
-        headers = {
-            "User-Agent": "Mozilla/5.0",
-            "Accept": "application/json, text/javascript, */*; q=0.01",
-            "Referer": "https://my.litefinance.org/",
-            "X-Requested-With": "XMLHttpRequest",
-        }
-        resp = requests.get(lite_finance_url, headers=headers, timeout=15)
+        resp = SESSION.get(lite_finance_url, timeout=15)
         resp.raise_for_status()
-        data = resp.json()
+        data = orjson.loads(resp.content) if orjson else resp.json()
         ohlc_data = data.get("data", {})
         if ohlc_data:
             return normalize_ohlc(ohlc_data, return_tz_offset_minutes=3 * 60 + 30)
     except Exception as e:
         print(f"[LiteFinance] OHLC error: {e}")
-    return pd.DataFrame()
+    return None  # no empty-DataFrame allocation on failure
 
 
-# --- save/append to csv ---
+# --- save/append: parquet is the history store, csv stays published for the front end ---
 def save_to_csv(df: pd.DataFrame, symbol: str, timeframe: str):
     os.makedirs("csv_data", exist_ok=True)
-    filename = f"csv_data/csv_{symbol.lower()}_{timeframe}.csv"
-
-    if os.path.exists(filename):
-        old_df = pd.read_csv(filename, parse_dates=["Date"])
-        df = pd.concat([old_df, df], ignore_index=True)
-        df.drop_duplicates(subset=["Date"], inplace=True)
-        df.sort_values("Date", inplace=True)
+    csv_file = f"csv_data/csv_{symbol.lower()}_{timeframe}.csv"
+    parquet_file = f"csv_data/csv_{symbol.lower()}_{timeframe}.parquet"
+
+    cols = ["Date", "Open", "High", "Low", "Close", "Volume"]
+    df = df[cols]
+
+    if os.path.exists(parquet_file):
+        old_df = pd.read_parquet(parquet_file)  # dtypes preserved, no date re-parse
+    elif os.path.exists(csv_file):
+        old_df = pd.read_csv(csv_file, parse_dates=["Date"])  # legacy pre-parquet history
+    else:
+        old_df = None
+
+    if old_df is None:
+        df.to_parquet(parquet_file, compression="zstd", index=False)
+        df.to_csv(csv_file, index=False)
+        print(f"Updated: {csv_file}")
+        return
+
+    # both sides are already sorted by Date, so an index merge beats
+    # concat + drop_duplicates (no hashing, no doubled frame, no re-sort).
+    # old values win for a duplicate Date, matching the baseline
+    # drop_duplicates(keep="first") and the append-only csv below
+    merged = old_df.set_index("Date").combine_first(df.set_index("Date"))
+    merged = merged.sort_index().reset_index()[cols]
+    merged.to_parquet(parquet_file, compression="zstd", index=False)
+
+    if os.path.exists(csv_file):
+        # stream-append: the published csv only ever receives rows newer
+        # than the stored history instead of being rewritten in full.
+        # max() skips NaT, so a null date in legacy history can't wedge
+        # the cutoff the way positional iloc[-1] could
+        new_rows = df[df["Date"] > old_df["Date"].max()]
+        if not new_rows.empty:
+            new_rows.to_csv(csv_file, mode="a", header=False, index=False)
+    else:
+        merged.to_csv(csv_file, index=False)
+    print(f"Updated: {csv_file}")
+
+
+MAX_FAILURES = 3  # consecutive failures before a symbol's remaining fetches are skipped
+_failures: dict[str, int] = {}
+
+
+def fetch_one(symbol: str, tf: str) -> pd.DataFrame | None:
+    # circuit breaker: stop hammering a symbol that keeps failing
+    if _failures.get(symbol, 0) >= MAX_FAILURES:
+        print(f"Skipping {symbol} {tf}: too many failures for this symbol")
+        return None
 
-    df.to_csv(filename, index=False, columns=["Date", "Open", "High", "Low", "Close", "Volume"])
-    print(f"Updated: {filename}")
+    # retries/backoff happen inside urllib3 via the session's Retry adapter
+    try:
+        df = get_ohlc(symbol, tf)
+        if df is not None and not df.empty:
+            _failures.pop(symbol, None)
+            return df
+    except Exception as e:
+        print(f"Fetch failed for {symbol} {tf}: {e}")
+    _failures[symbol] = _failures.get(symbol, 0) + 1
+    return None
 
 
 if __name__ == "__main__":
-    MAX_RETRIES = 3
-
-    for symbol in SYMBOLS:
-        for tf in TIMEFRAMES:
-            print(f"Fetching {symbol} {tf} ...")
-            df = pd.DataFrame()
-
-            for attempt in range(1, MAX_RETRIES + 1):
-                try:
-                    df = get_ohlc(symbol, tf)
-                    if not df.empty:
-                        break  # success, no need to retry
-                except Exception as e:
-                    print(f"Attempt {attempt} failed for {symbol} {tf}: {e}")
-                time.sleep(2)  # small delay before retry
-
-            if not df.empty:
+    jobs = [(symbol, tf) for symbol in SYMBOLS for tf in TIMEFRAMES]
+
+    # fetches are network-bound, so run them all concurrently on one pooled session
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_one, symbol, tf): (symbol, tf) for symbol, tf in jobs}
+        for future in as_completed(futures):
+            symbol, tf = futures[future]
+            df = future.result()
+
+            if df is not None and not df.empty:
                 save_to_csv(df, symbol, tf)
                 print(f"Saved {symbol} {tf} ✅")
             else:
-                print(f"Failed to fetch {symbol} {tf} after {MAX_RETRIES} retries ❌")
\ No newline at end of file
+                print(f"Failed to fetch {symbol} {tf} ❌")
\ No newline at end of file
@@ -0,0 +1,22 @@
+# test_save_data.py
+
+import numpy as np
+
+from save_data import to_unix_timestamp
+
+
+def test_batch_ints_match_scalar_path():
+    # mixed seconds and milliseconds epochs
+    values = [1700000000, 1700000060, 1_700_000_000_000]
+    assert to_unix_timestamp(values) == [to_unix_timestamp(v) for v in values]
+
+
+def test_batch_strings_match_scalar_path():
+    values = ["2023-11-14 22:13:20", "2024-01-01 00:00:00"]
+    assert to_unix_timestamp(values) == [to_unix_timestamp(v) for v in values]
+
+
+def test_batch_with_missing_values():
+    values = [1700000000, None, 1_700_000_000_000]
+    assert to_unix_timestamp(values) == [to_unix_timestamp(v) for v in values]
+    assert to_unix_timestamp(np.array([1.7e9, np.nan])) == [1700000000, None]